@@ -17,76 +17,96 @@
 
 import argparse
 import sys
-from modules.cantraces import OpenTraceFile
-import tkinter as tk
-from tkinter import filedialog
+import locale
+from modules.cantraces import OpenTraceFile, MergedTrace
+from modules.triggers import Rule, TriggeredTrace
+from modules.compressedfiles import isSupported, compressionFromName, sniffCompression
 from pathlib import Path
 
-initial_directory = str(Path.home())
 
-def show_interactive_window():
-
-    def open_file_dialog():
-        global initial_directory
-        file_paths = filedialog.askopenfilenames(f=[
-            ('PCAN Trace files','.trc'),
-            ('IXXAT Trace files','.csv'),
-            ('any extension','.*')            
-            ], 
-            initialdir=initial_directory
-        )
-        if file_paths:
-            initial_directory = str(Path(file_paths[0]).parent)
-            for f in file_paths:
-                trace = OpenTraceFile( f ) 
-                trace.toCSV( f + '.csv' )
-
-    # Create the main window
-    root = tk.Tk()
-    root.geometry("320x300")
-    root.title("analyze CANopen traces")
-
-    # label for help message
-    label = tk.Label(root, text=\
-    """    usage: 
-        analyze.py [-h] [-s SOURCE] [-o OUTPUT]
-
-    options:
-        -h, --help  show this help message and exit
-        -s SOURCE, --source SOURCE 
-            trace file (*.*)
-        -o OUTPUT, --output OUTPUT 
-            output file (*.csv)
-
-    example: 
-        analyze.py -s trace1.trc
-               
-        """, justify= tk.LEFT)
-    label.pack(pady=10)
-
-     # Create a button to open file dialog
-    file_button = tk.Button(root, text="Open SourceFile(s)", command=open_file_dialog)
-    file_button.pack(pady=10)
-
-    root.mainloop()
-                   
 if __name__ == '__main__':
     parser = argparse.ArgumentParser()
-    parser.add_argument("-s", "--source", help = "trace file (*.*)" )
-    parser.add_argument("-o", "--output", help = "output file (*.csv)")
+    parser.add_argument("-s", "--source", action = "append", help = "trace file (*.*), repeat to merge several traces by time" )
+    parser.add_argument("--offset", action = "append", type = float, default = [], help = "time offset [ms] of each source, in order of --source")
+    parser.add_argument("-o", "--output", help = "output file (*.csv, *.csv.gz, *.csv.xz, *.csv.zst) or SQLite database (*.db, *.sqlite)")
+    parser.add_argument("-t", "--threaded", action = "store_true", help = "compress and write output in a background thread")
+    parser.add_argument("-c", "--collapse", action = "store_true", help = "collapse repeated messages into summary rows")
+    parser.add_argument("-b", "--split-bus", action = "store_true", help = "write one output file per CAN bus")
+    parser.add_argument("-j", "--jobs", type = int, help = "number of parallel processes for --split-bus")
+    parser.add_argument("--trigger", action = "append", default = [], help = "write only messages around messages matching this rule, e.g. type=EMCY,node=5")
+    parser.add_argument("--rules", help = "file with one trigger rule per line")
+    parser.add_argument("--context", type = int, default = 10, help = "number of messages written before and after each trigger (default 10)")
+    parser.add_argument("--first", action = "store_true", help = "stop at the first trigger")
+    parser.add_argument("--watch", help = "service mode: convert trace files appearing in this directory")
+    parser.add_argument("--listen", type = int, help = "service mode: accept trace file names and 'stats' on this local TCP port (needs --output-dir)")
+    parser.add_argument("--output-dir", help = "service mode: directory for converted files (default: WATCH/converted)")
+    parser.add_argument("--extension", default = ".csv", help = "service mode: extension of converted files (default .csv)")
 
 
     args = parser.parse_args()
 
+    locale.setlocale(locale.LC_ALL, '')
+
     if len(sys.argv) == 1: # no arguments were given
+        from modules.gui import show_interactive_window # tkinter is not needed (and may be missing) otherwise
         show_interactive_window()
 
+    for output in ([args.output] if args.output else []) + ([args.extension] if args.watch or args.listen else []):
+        if not isSupported(compressionFromName(output)):
+            parser.error(f'{output}: zstd compression needs Python 3.14 or package zstandard')
+    for source in args.source or []:
+        if Path(source).is_file() and not isSupported(sniffCompression(source)):
+            parser.error(f'{source}: zstd compression needs Python 3.14 or package zstandard')
+
+    if args.listen and not (args.output_dir or args.watch):
+        parser.error('--listen needs --output-dir') # clients must not choose where files are written
+
+    if args.watch or args.listen:
+        from modules.service import runService
+        runService( args.watch, args.listen, args.output_dir, args.extension, args.jobs, args.collapse )
+        sys.exit(0)
+
+    if args.source and len(args.offset) > len(args.source):
+        parser.error('more --offset than --source given')
+
+    sqlite = args.output is not None and args.output.lower().endswith(('.db', '.sqlite', '.sqlite3'))
+    if sqlite and (args.collapse or args.threaded or args.split_bus):
+        parser.error('-c/--collapse, -t/--threaded and -b/--split-bus do not apply to SQLite output')
+
+    rules = list(args.trigger)
+    if args.rules:
+        with open(args.rules, 'r') as f:
+            rules += [ r.strip() for r in f if r.strip() and not r.lstrip().startswith('#') ]
+    try:
+        rules = [ Rule(r) for r in rules ]
+    except ValueError as e:
+        parser.error(str(e))
+
     if args.source:
-        trace = OpenTraceFile( args.source )                
+        lazy = len(args.source) > 1 or len(rules) > 0 # stream instead of loading
+        if len(args.source) > 1:
+            traces = [ OpenTraceFile( s, lazy = True ) for s in args.source ]
+            trace = MergedTrace( traces, args.offset, [ Path(s).name for s in args.source ] ) if all(traces) else None
+            name = args.source[0] + '.merged'
+        else:
+            trace = OpenTraceFile( args.source[0], lazy = lazy )
+            name = args.source[0]
+        if trace and rules:
+            trace = TriggeredTrace( trace, rules, args.context, args.context, args.first )
+            name = name + '.triggers'
         if trace:
-            if args.output:
-                trace.toCSV( args.output )
+            if sqlite:
+                try:
+                    traceId = trace.toSQLite( args.output, source = ', '.join(args.source) )
+                except ValueError as e:
+                    parser.error(str(e))
+                print( f'appended to {args.output} as trace_id {traceId}' )
+            elif args.split_bus:
+                for f in trace.toCSVPerBus( args.output or name + '.csv', background = args.threaded, workers = args.jobs, collapse = args.collapse ):
+                    print( f'written {f}' )
+            elif args.output:
+                trace.toCSV( args.output, background = args.threaded, collapse = args.collapse )
             else:
-                trace.toCSV( args.source + '.csv' )
-             
-
+                trace.toCSV( name + '.csv', background = args.threaded, collapse = args.collapse )
+            if rules:
+                print( f'{trace.hits} trigger(s)' )
@@ -223,19 +223,22 @@ class ErrCtrlMessage():
 
     '''
     data: data bytes    
+    heartbeats: time of last heartbeat per node, shared class dictionary if omitted
     '''
-    def __init__( self, data : bytes, nodeNumber : int, millis : int  ): 
+    def __init__( self, data : bytes, nodeNumber : int, millis : int, heartbeats : dict = None ): 
+        if heartbeats is None:
+            heartbeats = self.__class__.heartbeats
         if data is None:
             self.text = f'Node-Guarding Request (RTR)' 
         elif len(data) == 1:
             s = data[0] & 0x7f
             self.state = { 0 : 'Boot-Up', 4 : 'Stopped', 5: 'Operational', 127 : 'Preoperational'}.get(s, 'unknown')
-            previousHeartbeat = self.__class__.heartbeats.get( nodeNumber, -1 )
+            previousHeartbeat = heartbeats.get( nodeNumber, -1 )
             if previousHeartbeat >= 0:
                 self.text = f'Heartbeat: {self.state} ({millis-previousHeartbeat:0.1f} ms)'                
             else:
                 self.text = f'Heartbeat: {self.state}'
-            self.__class__.heartbeats.update( { nodeNumber : millis })
+            heartbeats.update( { nodeNumber : millis })
             s = s
         else:
             self.text = f'wrong Node-Guarding'
@@ -256,6 +259,7 @@ class SdoMessage():
     def __init__( self, data : bytes, client : bool ):  
         self.index = 0
         self.subindex = 0
+        self.abortCode = 0
         cs = (unpack_from( '<B', data )[0] & 0b11100000) >> 5 # command specifier
 
         if client:
@@ -294,8 +298,8 @@ class SdoMessage():
                 t = 'T' if (cb & 0b010000) else '!T'
                 self.text = f'client: upload segment request ({t})'
             elif cs == 4:
-                abortCode = unpack_from( '<L', data, 4 )[0]
-                message = SDO_ABORT_CODES.get(abortCode, f' abort code:{abortCode:#x}')                 
+                cb, self.index, self.subindex, self.abortCode = unpack_from( '<BHBL', data )
+                message = SDO_ABORT_CODES.get(self.abortCode, f' abort code:{self.abortCode:#x}')
                 self.text = f'client: abort transfer request: "{message}" '
             elif cs == 5: 
                 cb = data[0]
@@ -363,8 +367,8 @@ class SdoMessage():
                 self.text = 'server: initiate download response' 
 
             elif cs == 4:
-                abortCode = unpack_from( '<L', data, 4 )[0]                     
-                message = SDO_ABORT_CODES.get(abortCode, f' abort code:{abortCode:#x}')                 
+                cb, self.index, self.subindex, self.abortCode = unpack_from( '<BHBL', data )
+                message = SDO_ABORT_CODES.get(self.abortCode, f' abort code:{self.abortCode:#x}')
                 self.text = f'server: abort transfer request: "{message}" '
             elif cs == 5: 
                 cb = data[0]
@@ -448,13 +452,16 @@ class SdoMessage():
 
 
 class CanOpenMessage:
-
-    def __init__(self, number : int, millis : int, id : int, dlc : int, data : bytes ):
+    '''
+    heartbeats: decoder state of the CAN bus the message was received on (see ErrCtrlMessage)
+    '''
+    def __init__(self, number : int, millis : int, id : int, dlc : int, data : bytes, heartbeats : dict = None ):
         self.canOpenObject = CANopenType.NONE
         self.number = number
         self.nodeNumber = id & 0b1111111
         self.index = 0
         self.subindex = 0   
+        self.abortCode = 0
         self.canOpenObject = CANopenType( (id & 0b11110000000) >> 7 )
 
         if self.canOpenObject == CANopenType.NMT:
@@ -464,7 +471,7 @@ class CanOpenMessage:
         elif self.canOpenObject == CANopenType.EMCY and self.nodeNumber == 0: # SYNC from master
             self.text = f'SYNC'
         elif self.canOpenObject == CANopenType.EMCY: # EMCY from node
-            self.text = EmcyMessage(dlc, data)
+            self.text = str(EmcyMessage(dlc, data))
         elif self.canOpenObject == CANopenType.TIME and self.nodeNumber == 0:
             self.text = str(TimeMessage(data))
         elif self.canOpenObject == CANopenType.PDO1_T:
@@ -488,13 +495,15 @@ class CanOpenMessage:
             self.text = sdo.text
             self.index = sdo.index
             self.subindex = sdo.subindex
+            self.abortCode = sdo.abortCode
         elif self.canOpenObject == CANopenType.SDO_T and dlc == 8:
             sdo = SdoMessage( data, False)
             self.text = sdo.text
             self.index = sdo.index
             self.subindex = sdo.subindex
+            self.abortCode = sdo.abortCode
         elif self.canOpenObject == CANopenType.ERR_CTRL and dlc == 1:
-            self.text = str(ErrCtrlMessage( data = data, nodeNumber = self.nodeNumber, millis = millis ))
+            self.text = str(ErrCtrlMessage( data = data, nodeNumber = self.nodeNumber, millis = millis, heartbeats = heartbeats ))
         else:
             self.canOpenObject = CANopenType.NONE
             self.text = '' # no CanOpen Message
@@ -18,9 +18,16 @@ from pathlib import Path
 import re
 import csv
 import locale
+import struct
+import zlib
+import datetime
+import heapq
+from itertools import islice
 from modules.canobjects import *
+from modules.compressedfiles import openFile
 
-locale.setlocale(locale.LC_ALL, '')
+# the decimal separator of 'Time [ms]' follows the locale set by the application, 
+# e.g. locale.setlocale(locale.LC_ALL, '')
 
 
 class CanTraceType(Enum):
@@ -28,6 +35,7 @@ class CanTraceType(Enum):
     PCANVIEW_1_1 = 1 # tested PCAN-View Fileversion 1.1
     PCANVIEW_2_1 = 2 # tested PCAN-View Fileversion 2.1
     IXXAT_MINIMON_3 = 3 # tested IXXAT MiniMon V3
+    VECTOR_BLF = 4 # Vector binary logging format
 
 class CSVDialect(Enum):
     EXCEL_DIALECT1 = 1 # delimiter= ';', quotechar="'"
@@ -37,6 +45,7 @@ class CanTraceEntry():
     HEADER = [
         'Message Number', 
         'Time [ms]', 
+        'Bus', 
         'ID', 
         'DLC', 
         'Data Bytes', 
@@ -52,13 +61,17 @@ class CanTraceEntry():
     > canID : CAN-ID
     > dlc : CAN data length code
     > data : can data (0 - 8 bytes)
+    > bus : number of CAN bus (channel) the message was recorded on
     '''
-    def __init__(self, number : int, milliseconds : float, canId : int, dlc : int, data : bytes ):
+    def __init__(self, number : int, milliseconds : float, canId : int, dlc : int, data : bytes, bus : int = 1 ):
         self.number = number
         self.milliseconds = milliseconds
         self.canId = canId
         self.dlc = dlc
         self.data = data
+        self.bus = bus
+        self.source = None # name of the trace file, set if traces are merged
+        self.trigger = None # names of the matching trigger rules, set by TriggeredTrace
 
     @property
     def dataBytes(self) -> bytes:
@@ -71,58 +84,343 @@ class CanTraceEntry():
                 result = result + format(d, '#04x')
             return result + ']'
     
-    @property
-    def canOpen(self) -> CanOpenMessage:
+    '''
+    > heartbeats : decoder state of this entry's bus
+    '''
+    def interpret(self, heartbeats : dict ) -> CanOpenMessage:
         return CanOpenMessage( 
             self.number, 
             self.milliseconds, 
             self.canId, 
             self.dlc, 
-            self.data 
+            self.data,
+            heartbeats
         )
 
 
+class CollapsedRun():
+    '''
+    repetitions of a message with unchanged data
+    > e: first message of the run
+    > row: row of the first message
+    '''
+    def __init__(self, e : CanTraceEntry, row : list ):
+        self.data = e.data
+        self.dlc = e.dlc
+        self.row = row
+        self.milliseconds = e.milliseconds
+        self.lastMilliseconds = e.milliseconds
+        self.lastNumber = e.number
+        self.count = 0 # number of repetitions
+
+    def repeat(self, e : CanTraceEntry ):
+        self.lastMilliseconds = e.milliseconds
+        self.lastNumber = e.number
+        self.count = self.count + 1
+
+    def summary(self, interpretation : int ) -> list:
+        '''
+        > interpretation: column of the interpretation text
+        '''
+        period = (self.lastMilliseconds - self.milliseconds) / self.count
+        row = list(self.row)
+        row[0] = f'{self.row[0]}-{self.lastNumber}'
+        row[1] = locale.format_string('%01.3f', self.lastMilliseconds)
+        row[interpretation] = f'repeated {self.count} times until {row[1]} ms, mean period {locale.format_string("%01.1f", period)} ms'
+        return row
+
+
+
 class CanTrace():
+    canTraceType = CanTraceType.UNKNOWN
+    header = CanTraceEntry.HEADER
+
     '''
     > filename: trace file name
+    > progress: callback(bytes read, file size), may raise an exception to cancel
+    > lazy: do not load the entries, they are read from the file while iterating the trace
     '''
-    def __init__(self ):
-        self.canTraceType = CanTraceType.UNKNOWN
+    def __init__(self, filename = None, progress = None, lazy = False ):
+        self.filename = filename
+        self.progress = progress
+        self.startTime = None # date and time of 0 ms, known after the file header was read
         self.entries = list()
+        if filename is not None:
+            self.entries = None if lazy else list(self.parse())
 
+    '''
+    yields the entries read from the trace file
+    '''
+    def parse(self):
+        return iter(())
+
+    def __iter__(self):
+        return self.parse() if self.entries is None else iter(self.entries)
 
-    def toCSV(self, csvfilename, dialect = CSVDialect.EXCEL_DIALECT1 ):
-        with open( csvfilename, 'w', newline= '') as f:
+
+    '''
+    yields (entry, CanOpenMessage) for each entry. Each bus is a CANopen network of its own
+    and is interpreted with its own state.
+    > progress: callback(number of entries, total entries), may raise an exception to cancel
+    '''
+    def interpreted(self, progress = None ):
+        total = len(self.entries) if self.entries is not None else 0
+        states = dict() # (source, bus) -> heartbeats
+        for i, e in enumerate(self):
+            if progress and i % 1000 == 0:
+                progress(i, total)
+            heartbeats = states.get((e.source, e.bus))
+            if heartbeats is None:
+                heartbeats = states[(e.source, e.bus)] = dict()
+            yield e, e.interpret(heartbeats)
+
+
+    '''
+    yields the interpreted entries as rows of text (see header)
+    > progress: callback(number of rows, total rows), may raise an exception to cancel
+    '''
+    def rows(self, progress = None ):
+        for e, interpreted in self.interpreted(progress):
+            yield self.row(e, interpreted)
+
+
+    def row(self, e : CanTraceEntry, interpreted : CanOpenMessage ) -> list:
+        return [e.number, 
+                locale.format_string('%01.3f', e.milliseconds), 
+                e.bus,
+                format( e.canId, '#06x' ),
+                e.dlc,
+                e.dataBytes,
+                interpreted.canOpenObject.name,
+                interpreted.nodeNumber if interpreted.nodeNumber > 0 else '-',
+                format( interpreted.index, '#06x' ) if interpreted.index > 0 else '-',
+                interpreted.subindex if interpreted.index > 0 else '-',
+                interpreted.text  ]
+
+
+    '''
+    like rows(), but repeated messages (same bus, CAN id and data) are collapsed. 
+    Only the first message of a run is written, followed by a summary row when the data changes
+    or the trace ends: number of repetitions, last time and mean period.
+    Triggering messages are always written.
+    > progress: callback(number of rows, total rows), may raise an exception to cancel
+    > messages: (entry, CanOpenMessage) which were already interpreted by interpreted()
+    '''
+    def collapsedRows(self, progress = None, messages = None ):
+        interpretation = self.header.index('Interpretation')
+        runs = dict() # (source, bus, CAN id) -> CollapsedRun
+        for e, interpreted in (self.interpreted(progress) if messages is None else messages):
+            key = (e.source, e.bus, e.canId)
+            run = runs.get(key)
+            if run is not None and e.trigger is None and run.data == e.data and run.dlc == e.dlc:
+                run.repeat(e)
+                continue
+            if run is not None and run.count > 0:
+                yield run.summary(interpretation)
+            row = self.row(e, interpreted)
+            runs[key] = CollapsedRun(e, row)
+            yield row
+
+        for run in sorted(runs.values(), key = lambda r: r.lastMilliseconds):
+            if run.count > 0:
+                yield run.summary(interpretation)
+
+
+    '''
+    > csvfilename: output file name, compressed if it ends with .gz, .xz or .zst
+    > background: compress output in a separate thread
+    > rows: rows which were already interpreted by rows()
+    > collapse: collapse repeated messages (see collapsedRows())
+    '''
+    def toCSV(self, csvfilename, dialect = CSVDialect.EXCEL_DIALECT1, background = False, rows = None, collapse = False ):
+        if rows is None:
+            rows = self.collapsedRows() if collapse else self.rows()
+        with openFile( csvfilename, 'w', newline= '', background = background) as f:
             if dialect == CSVDialect.EXCEL_DIALECT1:
                 writer = csv.writer(f, delimiter= ';', quotechar="'" )
-            writer.writerow( CanTraceEntry.HEADER )
-            for e in self.entries:
-                interpreted = e.canOpen
-                writer.writerow( [e.number, 
-                                locale.format_string('%01.3f', e.milliseconds), 
-                                format( e.canId, '#06x' ),
-                                e.dlc,
-                                e.dataBytes,
-                                interpreted.canOpenObject.name,
-                                interpreted.nodeNumber if interpreted.nodeNumber > 0 else '-',
-                                format( interpreted.index, '#06x' ) if interpreted.index > 0 else '-',
-                                interpreted.subindex if interpreted.index > 0 else '-',
-                                interpreted.text  ] )
+            writer.writerow( self.header )
+            writer.writerows( rows )
+
+
+    '''
+    writes one CSV file per CAN bus (and trace file of merged traces), the buses are interpreted in parallel processes.
+    > csvfilename: output file name, the bus number is inserted before the extension (trace.bus1.csv, trace.merged.source.trc.bus1.csv)
+    > workers: number of processes, default is number of CPUs
+    returns the list of written files
+    '''
+    def toCSVPerBus(self, csvfilename, dialect = CSVDialect.EXCEL_DIALECT1, background = False, workers = None, collapse = False ):
+        buses = dict() # (source, bus) -> entries
+        for e in self:
+            buses.setdefault((e.source, e.bus), []).append(e)
+        filenames = [ self.busFilename(csvfilename, source, bus) for source, bus in buses ]
+
+        if len(buses) == 1:
+            self.toCSV( filenames[0], dialect, background, collapse = collapse )
+            return filenames
+
+        from concurrent.futures import ProcessPoolExecutor # imported on demand, it is slow to import
+        numeric = locale.setlocale(locale.LC_NUMERIC) # spawned processes do not inherit the locale
+        with ProcessPoolExecutor(max_workers = workers) as executor:
+            jobs = [ executor.submit(_busToCSV, self.emptyCopy(), entries, f, dialect, background, collapse, numeric) for entries, f in zip(buses.values(), filenames) ]
+            for job in jobs:
+                job.result()
+        return filenames
+
+
+    '''
+    inserts source (if not None) and bus number before the extension
+    '''
+    def busFilename(self, csvfilename, source : str, bus : int ) -> str:
+        name = str(csvfilename)
+        extension = name.lower().rfind('.csv')
+        if extension < 0:
+            extension = len(name)
+        part = f'.bus{bus}' if source is None else f'.{source}.bus{bus}'
+        return name[:extension] + part + name[extension:]
+
+
+    '''
+    returns a trace without entries which writes the same columns as this trace,
+    used to write a part of the entries in another process
+    '''
+    def emptyCopy(self) -> 'CanTrace':
+        return CanTrace()
+
+
+    SQL_SCHEMA = [
+        '''CREATE TABLE IF NOT EXISTS traces (
+            trace_id INTEGER PRIMARY KEY,
+            source TEXT,
+            format TEXT,
+            imported TEXT )''',
+        '''CREATE TABLE IF NOT EXISTS frames (
+            trace_id INTEGER NOT NULL REFERENCES traces(trace_id),
+            number INTEGER,
+            time_ms REAL,
+            source TEXT, -- trace file of the frame
+            bus INTEGER,
+            cob_id INTEGER,
+            dlc INTEGER,
+            data BLOB, -- NULL for RTR
+            type TEXT, -- CANopenType
+            node INTEGER,
+            od_index INTEGER,
+            od_subindex INTEGER,
+            abort_code INTEGER,
+            text TEXT,
+            trigger TEXT -- matching trigger rules, NULL for context messages and complete traces
+            )'''
+    ]
+
+    SQL_FRAME_COLUMNS = ['trace_id', 'number', 'time_ms', 'source', 'bus', 'cob_id', 'dlc', 'data', 'type', 'node', 'od_index', 'od_subindex', 'abort_code', 'text', 'trigger']
+
+    SQL_INDEXES = [
+        'CREATE INDEX IF NOT EXISTS frames_time ON frames (time_ms)',
+        'CREATE INDEX IF NOT EXISTS frames_cob_id ON frames (cob_id, time_ms)',
+        'CREATE INDEX IF NOT EXISTS frames_bus ON frames (bus, time_ms)',
+        'CREATE INDEX IF NOT EXISTS frames_node ON frames (node, type, time_ms)',
+        'CREATE INDEX IF NOT EXISTS frames_type ON frames (type, time_ms)',
+        'CREATE INDEX IF NOT EXISTS frames_od_index ON frames (od_index, od_subindex)',
+        'CREATE INDEX IF NOT EXISTS frames_trace ON frames (trace_id, number)'
+    ]
+
+    '''
+    appends the interpreted entries to a SQLite database, the trace gets a new trace_id.
+    > dbfilename: database file name, created if it does not exist
+    > source: name of the trace stored in table traces, and in table frames for entries without source (not merged)
+    > batchSize: number of frames inserted per transaction
+    returns the trace_id, raises ValueError if the database was created with another schema
+    '''
+    def toSQLite(self, dbfilename, source = None, batchSize = 50000 ):
+        import sqlite3 # imported on demand
+        connection = sqlite3.connect(dbfilename)
+        try:
+            connection.execute('PRAGMA journal_mode = WAL')
+            connection.execute('PRAGMA synchronous = NORMAL')
+            with connection:
+                for statement in __class__.SQL_SCHEMA:
+                    connection.execute(statement)
+                columns = [ c[1] for c in connection.execute('PRAGMA table_info(frames)') ]
+                missing = [ c for c in __class__.SQL_FRAME_COLUMNS if c not in columns ]
+                if missing:
+                    raise ValueError(f'{dbfilename}: table frames has no column {", ".join(missing)}, '
+                                     'the database was created by another version, use a new database')
+                traceId = connection.execute('INSERT INTO traces (source, format, imported) VALUES (?, ?, ?)',
+                    (source, self.canTraceType.name, datetime.datetime.now().isoformat(timespec = 'seconds'))).lastrowid
+
+            frames = ( (traceId,
+                        e.number,
+                        e.milliseconds,
+                        e.source if e.source is not None else source,
+                        e.bus,
+                        e.canId,
+                        e.dlc,
+                        e.data,
+                        interpreted.canOpenObject.name,
+                        interpreted.nodeNumber,
+                        interpreted.index if interpreted.index > 0 else None,
+                        interpreted.subindex if interpreted.index > 0 else None,
+                        interpreted.abortCode if interpreted.abortCode > 0 else None,
+                        interpreted.text,
+                        e.trigger) for e, interpreted in self.interpreted() )
+            insert = 'INSERT INTO frames ({}) VALUES ({})'.format( ', '.join(__class__.SQL_FRAME_COLUMNS), ', '.join('?' * len(__class__.SQL_FRAME_COLUMNS)) )
+            try:
+                while batch := list(islice(frames, batchSize)):
+                    with connection: # one transaction per batch
+                        connection.executemany(insert, batch)
+            except BaseException:
+                with connection: # remove incomplete trace
+                    connection.execute('DELETE FROM frames WHERE trace_id = ?', (traceId,))
+                    connection.execute('DELETE FROM traces WHERE trace_id = ?', (traceId,))
+                raise
+
+            # indexes are created after the first import, later imports update them
+            with connection:
+                for statement in __class__.SQL_INDEXES:
+                    connection.execute(statement)
+            return traceId
+        finally:
+            connection.close()
+
+
+
+def _busToCSV( trace : CanTrace, entries : list, csvfilename, dialect, background, collapse, numeric : str ):
+    '''
+    worker of CanTrace.toCSVPerBus()
+    > trace: empty trace which writes the columns (see CanTrace.emptyCopy())
+    > numeric: LC_NUMERIC locale of the main process
+    '''
+    locale.setlocale(locale.LC_NUMERIC, numeric)
+    trace.entries = entries
+    trace.toCSV( csvfilename, dialect, background, collapse = collapse )
+
+
+
+def _pcanStartTime( line : str ) -> datetime.datetime:
+    '''
+    $STARTTIME of PCAN-View traces is an OLE automation date (days since 30.12.1899)
+    '''
+    m = re.match(r';\$STARTTIME=(\d+\.?\d*)', line)
+    if m:
+        return datetime.datetime(1899, 12, 30) + datetime.timedelta(days = float(m[1]))
+    return None
 
 
 
 class PCANViewTrace_1_1( CanTrace):
+    canTraceType = CanTraceType.PCANVIEW_1_1
     patternEntry = re.compile(r'\s*(\d+)\x29\s*(\d+\.*\d*)\s*(Rx|Tx)\s*([0-9A-F]+)\s*([0-8])\s*(.*)')
     patternData = re.compile(r'([0-9A-F]{2})')
 
     '''
-    > filename: trace file name (*.trc)
+    reads trace file (*.trc)
     '''
-    def __init__(self, filename ): 
-        super().__init__()
-        with open(filename, 'r') as f:
-            content = f.readlines()
-            for r in content:
+    def parse(self): 
+        with openFile(self.filename, 'r', progress = self.progress) as f:
+            for r in f:
+                if r.startswith(';'):
+                    self.startTime = _pcanStartTime(r) or self.startTime
+                    continue
                 matches = __class__.patternEntry.findall(r)
                 if matches:
                     m = matches[0]
@@ -140,22 +438,24 @@ class PCANViewTrace_1_1( CanTrace):
                         data = __class__.patternData.findall(load)
                         data = bytes(int(d,16) for d in data)
 
-                    self.entries.append( CanTraceEntry( number = n, milliseconds = ms, canId = id, dlc = dlc, data = data ) )
+                    yield CanTraceEntry( number = n, milliseconds = ms, canId = id, dlc = dlc, data = data )
 
 
 
 class PCANViewTrace_2_1( CanTrace):
-    patternEntry = re.compile(r'\s*(\d+)\s*(\d+\.*\d*)\s*([A-Z]{2})\s*(\d)\s*([0-9A-F]+)\s*(Rx|Tx)\s*-\s*([0-8])\s*\s*(.*)')
+    canTraceType = CanTraceType.PCANVIEW_2_1
+    patternEntry = re.compile(r'\s*(\d+)\s*(\d+\.*\d*)\s*([A-Z]{2})\s*(\d+)\s+([0-9A-F]+)\s*(Rx|Tx)\s*-\s*([0-8])\s*\s*(.*)')
     patternData = re.compile(r'([0-9A-F]{2})')
 
     '''
-    > filename: trace file name (*.trc)
+    reads trace file (*.trc)
     '''
-    def __init__(self, filename ): 
-        super().__init__()
-        with open(filename, 'r') as f:
-            content = f.readlines()
-            for r in content:
+    def parse(self): 
+        with openFile(self.filename, 'r', progress = self.progress) as f:
+            for r in f:
+                if r.startswith(';'):
+                    self.startTime = _pcanStartTime(r) or self.startTime
+                    continue
                 matches = __class__.patternEntry.findall(r)
                 if matches:
                     m = matches[0]
@@ -174,24 +474,36 @@ class PCANViewTrace_2_1( CanTrace):
                         data = __class__.patternData.findall(load)
                         data = bytes(int(d,16) for d in data)
 
-                    self.entries.append( CanTraceEntry( number = n, milliseconds = ms, canId = id, dlc = dlc, data = data ) )           
+                    yield CanTraceEntry( number = n, milliseconds = ms, canId = id, dlc = dlc, data = data, bus = bus )
 
 
 
 class IXXATTrace( CanTrace):
+    canTraceType = CanTraceType.IXXAT_MINIMON_3
     patternEntry = re.compile(r'"(\d{2}):(\d{2}):(\d{2}\.\d*)";"(\d{1,3})";"(\w*)";"([\w\s]*)";"([\w\s=]*)"')
     patternData = re.compile(r'([0-9A-F]{2})')
     patternRTR = re.compile(r'Remote request\s*DLC\s*=\s*(\d)')
+    patternDate = re.compile(r'Date:\s*(\d{2})\.(\d{2})\.(\d{4})')
+    patternStartTime = re.compile(r'Start time:\s*(\d{2}):(\d{2}):(\d{2})')
+
+    DAY = 24 * 3600 * 1000 # ms
 
     '''
-    > filename: trace file name (*.CSV)
+    reads trace file (*.CSV)
     '''
-    def __init__(self, filename ): 
-        super().__init__()
+    def parse(self): 
         n = 0 # message number
-        with open(filename, 'r') as f:
-            content = f.readlines()
-            for r in content:
+        day = 0 # time stamps are HH:MM:SS and wrap after 24h
+        previous = 0
+        date = None
+        with openFile(self.filename, 'r', progress = self.progress) as f:
+            for r in f:
+                if date is None and (d := __class__.patternDate.match(r)):
+                    date = datetime.datetime(int(d[3]), int(d[2]), int(d[1]))
+                    continue
+                if date is not None and self.startTime is None and (t := __class__.patternStartTime.match(r)):
+                    self.startTime = date + datetime.timedelta(hours = int(t[1]), minutes = int(t[2]), seconds = int(t[3]))
+                    continue
                 matches = __class__.patternEntry.findall(r)
                 if matches:
                     n = n + 1
@@ -200,6 +512,10 @@ class IXXATTrace( CanTrace):
                     minute = int(m[1])
                     seconds = float(m[2])
                     ms = (hour * 3600 + minute * 60 + seconds) * 1000
+                    if ms + day * __class__.DAY < previous - __class__.DAY / 2:
+                        day = day + 1
+                    ms = ms + day * __class__.DAY
+                    previous = ms
                     id = int(m[3],16)
                     format = m[4] # 'Std' or 'Ext' ?`
                     flags = m[5] # 'Rtr' or ?
@@ -215,13 +531,210 @@ class IXXATTrace( CanTrace):
                         data = bytes(int(d,16) for d in data)
                         dlc = len(data)
 
-                    if n == 571:
-                        pass
-                    self.entries.append( CanTraceEntry( number = n, milliseconds = ms, canId = id, dlc = dlc, data = data ) )
+                    yield CanTraceEntry( number = n, milliseconds = ms, canId = id, dlc = dlc, data = data )
 
 
 
-def OpenTraceFile( filename : str ) -> CanTrace:
+class VectorBLFTrace( CanTrace):
+    canTraceType = CanTraceType.VECTOR_BLF
+    signature = b'LOGG'
+    objectSignature = b'LOBJ'
+    fileHeader = struct.Struct('<4sL32x8H') # signature, header size, measurement start (SYSTEMTIME)
+    objectHeader = struct.Struct('<4sHHLL') # signature, header size, header version, object size, object type
+    objectHeaderV1 = struct.Struct('<LHHQ') # flags, client index, object version, timestamp
+    objectHeaderV2 = struct.Struct('<LBBHQ') # flags, timestamp status, reserved, object version, timestamp
+    containerHeader = struct.Struct('<H6xL4x') # compression method, uncompressed size
+    canMessage = struct.Struct('<HBBL') # channel, flags, dlc, CAN id (followed by 8 data bytes)
+
+    LOG_CONTAINER = 10
+    CAN_MESSAGE = 1
+    CAN_MESSAGE2 = 86
+    NO_COMPRESSION = 0
+    ZLIB_DEFLATE = 2
+    TIME_TEN_MICS = 1
+    TIME_ONE_NANS = 2
+    REMOTE_FLAG = 0x80
+
+    '''
+    reads trace file (*.blf)
+    '''
+    def parse(self):
+        n = 0 # message number
+        for timestamp, channel, canId, dlc, data in self.readMessages(self.filename, self.progress):
+            n = n + 1
+            yield CanTraceEntry( number = n, milliseconds = timestamp, canId = canId, dlc = dlc, data = data, bus = channel )
+
+
+    def readContainers(self, f ):
+        '''
+        yields the uncompressed content of all log containers in file f.
+        A truncated file ends after the readable part of its last container, a corrupt container
+        yields its readable part followed by None (the following objects cannot continue it).
+        '''
+        header = f.read(__class__.fileHeader.size)
+        if len(header) < __class__.fileHeader.size:
+            return
+        signature, headerSize, year, month, dayOfWeek, day, hour, minute, second, ms = __class__.fileHeader.unpack(header)
+        f.read(max(headerSize - __class__.fileHeader.size, 0)) # compressed streams do not support seek() well
+        if year > 0:
+            try:
+                self.startTime = datetime.datetime(year, month, day, hour, minute, second, ms * 1000)
+            except ValueError: # corrupt header
+                pass
+        while True:
+            header = f.read(__class__.objectHeader.size)
+            if len(header) < __class__.objectHeader.size:
+                break
+            signature, _, _, objectSize, objectType = __class__.objectHeader.unpack(header)
+            if signature != __class__.objectSignature or objectSize < __class__.objectHeader.size: # corrupt file
+                break
+            content = f.read( objectSize - __class__.objectHeader.size )
+            truncated = len(content) < objectSize - __class__.objectHeader.size
+            f.read( objectSize % 4 ) # padding
+            if objectType == __class__.LOG_CONTAINER and len(content) >= __class__.containerHeader.size:
+                method, _ = __class__.containerHeader.unpack_from(content)
+                payload = memoryview(content)[__class__.containerHeader.size:]
+                if method == __class__.ZLIB_DEFLATE:
+                    yield from self.inflate(payload)
+                elif method == __class__.NO_COMPRESSION:
+                    yield payload
+            if truncated:
+                break
+
+
+    def inflate(self, payload ):
+        '''
+        yields the uncompressed payload of a container. A truncated stream yields what was decompressed,
+        a corrupt stream the part before the error followed by None.
+        '''
+        decompressor = zlib.decompressobj()
+        data = bytearray()
+        try:
+            for i in range(0, len(payload), 65536): # in pieces, so that the part before an error is kept
+                data += decompressor.decompress(payload[i:i + 65536])
+        except zlib.error:
+            yield data
+            yield None
+            return
+        yield data
+
+
+    def readMessages(self, filename, progress = None ):
+        '''
+        yields (milliseconds, channel, CAN id, dlc, data) for each CAN message in the file.
+        Objects can span container boundaries, so unparsed bytes are carried over
+        to the next container. Header fields are decoded in place from the buffer,
+        only the data bytes of each message are copied.
+        '''
+        objectHeader = __class__.objectHeader
+        canMessage = __class__.canMessage
+        buffer = bytearray()
+        skip = 0 # padding of the last object which did not fit into the previous container
+        with openFile(filename, 'rb', progress = progress) as f:
+            for container in self.readContainers(f):
+                if container is None: # corrupt container, its incomplete last object is dropped
+                    buffer.clear()
+                    skip = 0
+                    continue
+                buffer += container
+                pos = skip
+                end = len(buffer)
+                with memoryview(buffer) as view:
+                    while pos + objectHeader.size <= end:
+                        signature, headerSize, headerVersion, objectSize, objectType = objectHeader.unpack_from(view, pos)
+                        if signature != __class__.objectSignature or objectSize < headerSize or headerSize < objectHeader.size: # resynchronize on the next object
+                            nextObject = buffer.find(__class__.objectSignature, pos + 1)
+                            if nextObject < 0:
+                                pos = max(pos, end - 3)
+                                break
+                            pos = nextObject
+                            continue
+                        if pos + objectSize > end: # object continues in the next container
+                            break
+                        if (objectType == __class__.CAN_MESSAGE or objectType == __class__.CAN_MESSAGE2) and objectSize >= headerSize + canMessage.size + 8:
+                            h = pos + objectHeader.size
+                            if headerVersion == 1:
+                                flags, _, _, timestamp = __class__.objectHeaderV1.unpack_from(view, h)
+                            else:
+                                flags, _, _, _, timestamp = __class__.objectHeaderV2.unpack_from(view, h)
+                            if flags == __class__.TIME_TEN_MICS:
+                                ms = timestamp / 100
+                            else:
+                                ms = timestamp / 1000000
+                            b = pos + headerSize
+                            channel, msgFlags, dlc, canId = canMessage.unpack_from(view, b)
+                            if msgFlags & __class__.REMOTE_FLAG:
+                                data = None
+                            else:
+                                d = b + canMessage.size
+                                data = bytes(view[d:d + min(dlc, 8)])
+                            yield ms, channel, canId & 0x1fffffff, dlc, data
+                        pos += objectSize + objectSize % 4
+                skip = max(pos - end, 0)
+                del buffer[:pos]
+
+
+
+class MergedTrace( CanTrace):
+    header = CanTraceEntry.HEADER + ['Source']
+
+    '''
+    merges several traces into one timeline. Time 0 is the earliest start time of all traces,
+    entries are renumbered and tagged with the name of their trace.
+    Only one entry per trace is held in memory, so the traces should be opened with lazy = True.
+    > traces: traces to merge
+    > offsets: time offset [ms] added to each trace
+    > sources: name of each trace
+    '''
+    def __init__(self, traces : list, offsets : list = None, sources : list = None ):
+        super().__init__()
+        self.traces = traces
+        self.offsets = list(offsets or []) + [0.0] * (len(traces) - len(offsets or []))
+        self.sources = sources or [ t.filename for t in traces ]
+        self.entries = None
+
+    def parse(self):
+        iterators = [ iter(t) for t in self.traces ]
+        first = [ next(it, None) for it in iterators ] # reads the file headers
+
+        startTimes = [ t.startTime for t in self.traces if t.startTime is not None ]
+        self.startTime = min(startTimes) if startTimes else None
+        shift = list(self.offsets)
+        for i, t in enumerate(self.traces):
+            if t.startTime is not None:
+                shift[i] += (t.startTime - self.startTime).total_seconds() * 1000
+
+        # there is never more than one entry of a trace in the heap, so (time, trace) is unique
+        heap = [ (e.milliseconds + shift[i], i, e) for i, e in enumerate(first) if e is not None ]
+        heapq.heapify(heap)
+        n = 0
+        while heap:
+            ms, i, e = heap[0]
+            following = next(iterators[i], None)
+            if following is None:
+                heapq.heappop(heap)
+            else:
+                heapq.heapreplace(heap, (following.milliseconds + shift[i], i, following))
+            n = n + 1
+            e.number = n
+            e.milliseconds = ms
+            e.source = self.sources[i]
+            yield e
+
+    def row(self, e : CanTraceEntry, interpreted : CanOpenMessage ) -> list:
+        return super().row(e, interpreted) + [e.source]
+
+    def emptyCopy(self) -> CanTrace:
+        return MergedTrace([])
+
+
+
+def OpenTraceFile( filename : str, progress = None, lazy = False ) -> CanTrace:
+    '''
+    > filename: trace file name, may be compressed with gzip, xz or zstd
+    > progress: callback(bytes read, file size), may raise an exception to cancel
+    > lazy: read entries from file while iterating the trace instead of loading them
+    '''
 
     headers = {
         re.compile(r";\$FILEVERSION=1\.1[\s\S]*\$STARTTIME[\s\S]*Generated by"): CanTraceType.PCANVIEW_1_1,
@@ -231,7 +744,13 @@ def OpenTraceFile( filename : str ) -> CanTrace:
 
     file = Path(filename)
     if file.is_file():
-        with open(filename, 'r') as f:
+        # format is sniffed from the decompressed header
+        with openFile(filename, 'rb') as f:
+            if f.read(4) == VectorBLFTrace.signature:
+                print( f'convert {filename} from Vector BLF' )
+                return VectorBLFTrace( filename, progress, lazy )
+
+        with openFile(filename, 'r') as f:
             h = []
             for i in range(0, 16):
                 h.append(f.readline())
@@ -242,13 +761,13 @@ def OpenTraceFile( filename : str ) -> CanTrace:
                 if m:
                     if v == CanTraceType.PCANVIEW_1_1:
                         print( f'convert {filename} from PCAN-View 1.1' )
-                        return PCANViewTrace_1_1( filename )
+                        return PCANViewTrace_1_1( filename, progress, lazy )
                     elif v == CanTraceType.PCANVIEW_2_1:
                         print( f'convert {filename} from PCAN-View 2.1' )
-                        return PCANViewTrace_2_1( filename )
+                        return PCANViewTrace_2_1( filename, progress, lazy )
                     elif v == CanTraceType.IXXAT_MINIMON_3:
                         print( f'convert {filename} from IXXAT MiniMon V3' )
-                        return IXXATTrace( filename )
+                        return IXXATTrace( filename, progress, lazy )
                 
             print( 'unknown trace file format' )
             return None
@@ -0,0 +1,217 @@
+# This file is part of https://github.com/hilch/canopen-message-interpreter.
+#
+#    canopen-message-interpreter is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    canopen-message-interpreter is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with canopen-message-interpreter.  If not, see <http://www.gnu.org/licenses/>.
+
+# transparent (de)compression of trace and output files
+
+from enum import Enum
+import io
+import os
+import gzip
+import lzma
+import queue
+import threading
+
+try:
+    from compression import zstd # Python 3.14
+except ImportError:
+    try:
+        import zstandard as zstd # optional: pip install zstandard
+    except ImportError:
+        zstd = None
+
+
+class Compression(Enum):
+    NONE = 0
+    GZIP = 1
+    XZ = 2
+    ZSTD = 3
+
+
+MAGIC = {
+    b'\x1f\x8b' : Compression.GZIP,
+    b'\xfd7zXZ\x00' : Compression.XZ,
+    b'\x28\xb5\x2f\xfd' : Compression.ZSTD
+}
+
+EXTENSIONS = {
+    '.gz' : Compression.GZIP,
+    '.xz' : Compression.XZ,
+    '.zst' : Compression.ZSTD
+}
+
+CHUNK_SIZE = 1 << 20 # bytes handed over to the compression thread at once
+
+
+def sniffCompression( filename : str ) -> Compression:
+    '''
+    detects the compression of an existing file by its magic bytes
+    '''
+    with open(filename, 'rb') as f:
+        head = f.read(6)
+    for magic, compression in MAGIC.items():
+        if head.startswith(magic):
+            return compression
+    return Compression.NONE
+
+
+def compressionFromName( filename : str ) -> Compression:
+    '''
+    selects the compression of a new file by its extension
+    '''
+    for extension, compression in EXTENSIONS.items():
+        if str(filename).lower().endswith(extension):
+            return compression
+    return Compression.NONE
+
+
+def isSupported( compression : Compression ) -> bool:
+    '''
+    zstd needs Python 3.14 or package zstandard, all other compressions are always available
+    '''
+    return compression != Compression.ZSTD or zstd is not None
+
+
+def openBinary( filename, mode : str, compression : Compression ):
+    '''
+    > filename: file name or binary file object
+    '''
+    if compression == Compression.GZIP:
+        return gzip.open(filename, mode)
+    elif compression == Compression.XZ:
+        return lzma.open(filename, mode)
+    elif compression == Compression.ZSTD:
+        if not isSupported(compression):
+            raise RuntimeError('zstd compression needs Python 3.14 or package zstandard')
+        return zstd.open(filename, mode)
+    return open(filename, mode)
+
+
+class ProgressReader(io.BufferedIOBase):
+    '''
+    reports the position in the (compressed) file after each read as progress(position, total).
+    progress may raise an exception to cancel reading.
+    '''
+    def __init__(self, raw, stream, progress ):
+        self.raw = raw
+        self.stream = stream
+        self.progress = progress
+        self.total = os.fstat(raw.fileno()).st_size
+
+    def readable(self):
+        return True
+
+    def read(self, size = -1):
+        data = self.stream.read(size)
+        self.progress(self.raw.tell(), self.total)
+        return data
+
+    def read1(self, size = -1):
+        data = self.stream.read1(size)
+        self.progress(self.raw.tell(), self.total)
+        return data
+
+    def close(self):
+        if self.closed:
+            return
+        try:
+            if self.stream is not self.raw:
+                self.stream.close()
+        finally:
+            self.raw.close()
+            super().close()
+
+
+class _QueueWriter(io.RawIOBase):
+    '''
+    raw stream which hands all written chunks over to a queue
+    '''
+    def __init__(self, chunks : queue.Queue ):
+        self.chunks = chunks
+
+    def writable(self):
+        return True
+
+    def write(self, b):
+        self.chunks.put(bytes(b))
+        return len(b)
+
+
+class BackgroundWriter(io.TextIOWrapper):
+    '''
+    text file whose compression (if any) and disk writes run in a separate thread.
+    Formatting in the caller overlaps with compressing and writing the previous chunks.
+    '''
+    def __init__(self, filename : str, compression : Compression, newline = None ):
+        self.target = openBinary(filename, 'wb', compression)
+        self.chunks = queue.Queue(maxsize = 8)
+        self.error = None
+        self.thread = threading.Thread(target = self.run, daemon = True)
+        self.thread.start()
+        super().__init__( io.BufferedWriter(_QueueWriter(self.chunks), CHUNK_SIZE), newline = newline )
+
+    def run(self):
+        try:
+            while (chunk := self.chunks.get()) is not None:
+                self.target.write(chunk)
+        except Exception as e:
+            self.error = e
+            while self.chunks.get() is not None: # drain queue so that the writer does not block
+                pass
+        finally:
+            self.target.close()
+
+    def close(self):
+        if self.closed:
+            return
+        try:
+            super().close()
+        finally:
+            self.chunks.put(None)
+            self.thread.join()
+        if self.error is not None:
+            raise self.error
+
+
+def openFile( filename : str, mode : str = 'r', newline = None, background : bool = False, progress = None ):
+    '''
+    opens a file which may be compressed with gzip, xz or zstd.
+    > mode: 'r', 'rb' (compression detected by content) or 'w', 'wb' (compression selected by extension)
+    > background: compress and write in a separate thread (text write mode only)
+    > progress: callback(position, total) with the number of (compressed) bytes read so far (read mode only)
+    '''
+    if 'r' in mode:
+        compression = sniffCompression(filename)
+    else:
+        compression = compressionFromName(filename)
+
+    if progress is not None and 'r' in mode:
+        raw = open(filename, 'rb')
+        stream = raw if compression == Compression.NONE else openBinary(raw, 'rb', compression)
+        reader = ProgressReader(raw, stream, progress)
+        if 'b' in mode:
+            return reader
+        return io.TextIOWrapper( reader, newline = newline )
+
+    if background and 'w' in mode and 'b' not in mode:
+        return BackgroundWriter(filename, compression, newline = newline)
+
+    if compression == Compression.NONE:
+        if 'b' in mode:
+            return open(filename, mode)
+        return open(filename, mode, newline = newline)
+
+    if 'b' in mode:
+        return openBinary(filename, mode, compression)
+    return io.TextIOWrapper( openBinary(filename, mode + 'b', compression), newline = newline )
@@ -0,0 +1,281 @@
+# This file is part of https://github.com/hilch/canopen-message-interpreter.
+#
+#    canopen-message-interpreter is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    canopen-message-interpreter is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with canopen-message-interpreter.  If not, see <http://www.gnu.org/licenses/>.
+
+# interactive window, imported only if analyze.py is started without arguments
+
+import os
+import csv
+import queue
+import locale
+import threading
+from array import array
+import tkinter as tk
+from tkinter import filedialog, messagebox, ttk
+from pathlib import Path
+from modules.cantraces import OpenTraceFile
+
+initial_directory = str(Path.home())
+
+
+class ConversionCancelled(Exception):
+    pass
+
+
+class CSVRows():
+    '''
+    rows of a CSV file written by CanTrace.toCSV(), read on demand.
+    Only the position of each line is kept in memory (8 bytes per row).
+    > filename: CSV file
+    > progress: callback(bytes read, file size), may raise an exception to cancel
+    '''
+    def __init__(self, filename : str, progress = None ):
+        self.encoding = locale.getpreferredencoding(False) # toCSV() writes with the default encoding
+        self.offsets = array('Q')
+        self.file = open(filename, 'rb')
+        total = os.fstat(self.file.fileno()).st_size
+        self.header = self.parse(self.file.readline())
+        position = self.file.tell()
+        for i, line in enumerate(self.file):
+            self.offsets.append(position)
+            position = position + len(line)
+            if progress and i % 10000 == 0:
+                progress(position, total)
+
+    def parse(self, line : bytes ) -> list:
+        return next(csv.reader([line.decode(self.encoding)], delimiter = ';', quotechar = "'"))
+
+    def __len__(self):
+        return len(self.offsets)
+
+    def __getitem__(self, n : int ) -> list:
+        self.file.seek(self.offsets[n])
+        return self.parse(self.file.readline())
+
+
+
+class ResultViewer(tk.Toplevel):
+    '''
+    shows interpreted messages in a table. Only the visible rows are read and rendered, 
+    so the number of messages does not matter.
+    > rows: CSVRows of the converted file
+    '''
+    ROW_HEIGHT = 20
+
+    def __init__(self, master, title : str, rows : CSVRows ):
+        super().__init__(master)
+        self.title(title)
+        self.geometry("1200x600")
+        self.rows = rows
+        header = rows.header
+        self.offset = 0 # index of first visible row
+        self.items = [] # reused tree items, one for each visible row
+
+        ttk.Style(self).configure('Treeview', rowheight = __class__.ROW_HEIGHT)
+        self.tree = ttk.Treeview(self, columns = header, show = 'headings', selectmode = 'browse')
+        for c in header:
+            self.tree.heading(c, text = c, anchor = tk.W)
+            self.tree.column(c, width = 80, stretch = False)
+        self.tree.column(header[-1], width = 600, stretch = True)
+        self.scrollbar = ttk.Scrollbar(self, orient = tk.VERTICAL, command = self.scroll)
+        self.scrollbar.pack(side = tk.RIGHT, fill = tk.Y)
+        self.tree.pack(side = tk.LEFT, fill = tk.BOTH, expand = True)
+
+        self.tree.bind('<Configure>', lambda e: self.render())
+        self.tree.bind('<MouseWheel>', lambda e: self.moveTo(self.offset - e.delta // 40)) # Windows
+        self.tree.bind('<Button-4>', lambda e: self.moveTo(self.offset - 3)) # X11
+        self.tree.bind('<Button-5>', lambda e: self.moveTo(self.offset + 3))
+        self.tree.bind('<Prior>', lambda e: self.moveTo(self.offset - self.visibleRows()))
+        self.tree.bind('<Next>', lambda e: self.moveTo(self.offset + self.visibleRows()))
+        self.tree.bind('<Home>', lambda e: self.moveTo(0))
+        self.tree.bind('<End>', lambda e: self.moveTo(len(self.rows)))
+
+
+    def visibleRows(self) -> int:
+        # height of the tree minus heading
+        return max(1, self.tree.winfo_height() // __class__.ROW_HEIGHT - 1)
+
+
+    def scroll(self, *args ):
+        if args[0] == 'moveto':
+            self.moveTo( int(float(args[1]) * len(self.rows)) )
+        elif args[0] == 'scroll':
+            step = self.visibleRows() if args[2] == 'pages' else 1
+            self.moveTo( self.offset + int(args[1]) * step )
+
+
+    def moveTo(self, offset : int ):
+        self.offset = max(0, min(offset, len(self.rows) - self.visibleRows()))
+        self.render()
+        return 'break'
+
+
+    def render(self):
+        visible = self.visibleRows()
+        while len(self.items) < visible:
+            self.items.append( self.tree.insert('', tk.END) )
+        while len(self.items) > visible:
+            self.tree.delete( self.items.pop() )
+
+        self.offset = max(0, min(self.offset, len(self.rows) - visible))
+        for i, item in enumerate(self.items):
+            n = self.offset + i
+            self.tree.item(item, values = self.rows[n] if n < len(self.rows) else ())
+
+        if self.rows:
+            self.scrollbar.set( self.offset / len(self.rows), min(1.0, (self.offset + visible) / len(self.rows)) )
+        else:
+            self.scrollbar.set(0.0, 1.0)
+
+
+
+def show_interactive_window():
+
+    messages = queue.Queue() # worker thread -> GUI
+    cancel = threading.Event()
+    results = [] # (file name, CSVRows) of the last conversion
+
+    def convert( file_paths ):
+        '''
+        runs in worker thread, must not touch any widget
+        '''
+        percent = -1
+
+        def report( text, done, total ):
+            nonlocal percent
+            if cancel.is_set(): raise ConversionCancelled()
+            p = int(100 * done / total) if total else 100
+            if p != percent: # report only changes, reading calls back for each block
+                percent = p
+                messages.put( ('progress', text, p) )
+
+        def reading( position, total ):
+            report( f'converting {Path(f).name}', position, total )
+
+        def indexing( position, total ):
+            report( f'indexing {Path(f).name}.csv', position, total )
+
+        try:
+            for f in file_paths:
+                # reading, interpreting and writing run in one pass, so reading reports progress and cancels
+                trace = OpenTraceFile( f, progress = reading, lazy = True )
+                if trace is None:
+                    messages.put( ('error', f'{Path(f).name}: unknown trace file format') )
+                    continue
+                output = f + '.csv'
+                try:
+                    trace.toCSV( output )
+                except BaseException:
+                    Path(output).unlink(missing_ok = True) # remove incomplete file
+                    raise
+                messages.put( ('done', f, CSVRows( output, progress = indexing )) )
+            messages.put( ('finished', ) )
+        except ConversionCancelled:
+            messages.put( ('cancelled', ) )
+        except Exception as e:
+            messages.put( ('error', str(e)) )
+            messages.put( ('finished', ) )
+
+    def poll():
+        '''
+        processes messages from the worker thread in the GUI thread
+        '''
+        try:
+            while True:
+                m = messages.get_nowait()
+                if m[0] == 'progress':
+                    status.set( m[1] )
+                    progress['value'] = m[2]
+                elif m[0] == 'done':
+                    results.append( m[1:] )
+                    result_list.insert( tk.END, Path(m[1]).name )
+                elif m[0] == 'error':
+                    messagebox.showerror( 'analyze CANopen traces', m[1] )
+                elif m[0] in ('finished', 'cancelled'):
+                    status.set( 'cancelled' if m[0] == 'cancelled' else 'ready' )
+                    progress['value'] = 0
+                    file_button['state'] = tk.NORMAL
+                    cancel_button['state'] = tk.DISABLED
+                    return
+        except queue.Empty:
+            pass
+        root.after(100, poll)
+
+    def show_result( event = None ):
+        for i in result_list.curselection():
+            f, rows = results[i]
+            ResultViewer( root, Path(f).name, rows )
+
+    def open_file_dialog():
+        global initial_directory
+        file_paths = filedialog.askopenfilenames(f=[
+            ('PCAN Trace files','.trc'),
+            ('IXXAT Trace files','.csv'),
+            ('Vector BLF files','.blf'),
+            ('any extension','.*')            
+            ], 
+            initialdir=initial_directory
+        )
+        if file_paths:
+            initial_directory = str(Path(file_paths[0]).parent)
+            cancel.clear()
+            results.clear() # files of open viewers stay open until the viewer is closed
+            result_list.delete(0, tk.END)
+            file_button['state'] = tk.DISABLED
+            cancel_button['state'] = tk.NORMAL
+            threading.Thread( target = convert, args = (file_paths,), daemon = True ).start()
+            poll()
+
+    # Create the main window
+    root = tk.Tk()
+    root.geometry("320x520")
+    root.title("analyze CANopen traces")
+
+    # label for help message
+    label = tk.Label(root, text=\
+    """    usage: 
+        analyze.py [-h] [-s SOURCE] [-o OUTPUT]
+
+    options:
+        -h, --help  show this help message and exit
+        -s SOURCE, --source SOURCE 
+            trace file (*.*)
+        -o OUTPUT, --output OUTPUT 
+            output file (*.csv)
+
+    example: 
+        analyze.py -s trace1.trc
+               
+        """, justify= tk.LEFT)
+    label.pack(pady=10)
+
+     # Create a button to open file dialog
+    file_button = tk.Button(root, text="Open SourceFile(s)", command=open_file_dialog)
+    file_button.pack(pady=10)
+
+    # progress of conversion
+    status = tk.StringVar(root, 'ready')
+    tk.Label(root, textvariable=status).pack()
+    progress = ttk.Progressbar(root, length=280, maximum=100)
+    progress.pack(pady=5)
+    cancel_button = tk.Button(root, text="Cancel", command=cancel.set, state=tk.DISABLED)
+    cancel_button.pack(pady=5)
+
+    # converted files, double click shows the messages
+    tk.Label(root, text="converted files (double click to show):").pack()
+    result_list = tk.Listbox(root, height=5, width=40)
+    result_list.pack(pady=5)
+    result_list.bind('<Double-Button-1>', show_result)
+
+    root.mainloop()
@@ -0,0 +1,235 @@
+# This file is part of https://github.com/hilch/canopen-message-interpreter.
+#
+#    canopen-message-interpreter is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    canopen-message-interpreter is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with canopen-message-interpreter.  If not, see <http://www.gnu.org/licenses/>.
+
+# long running conversion service: watch folder and local socket feed a pool of warm worker processes
+
+import os
+import json
+import time
+import locale
+import signal
+import threading
+import socketserver
+from pathlib import Path
+from concurrent.futures import ProcessPoolExecutor
+from modules.cantraces import OpenTraceFile
+
+
+def _initWorker( numeric : str ):
+    '''
+    runs once in each worker process, the imported modules stay loaded for all following jobs
+    > numeric: LC_NUMERIC locale of the service process
+    '''
+    locale.setlocale(locale.LC_NUMERIC, numeric)
+    signal.signal(signal.SIGINT, signal.SIG_IGN) # Ctrl+C is handled by the service process
+
+
+def _convert( source : str, output : str, collapse : bool ) -> tuple:
+    '''
+    converts one trace in a worker process. The trace is streamed, it is never held in memory.
+    The output is written to a hidden file first, so that it never appears half written.
+    returns (number of messages, bytes read, seconds)
+    '''
+    start = time.perf_counter()
+    trace = OpenTraceFile( source, lazy = True )
+    if trace is None:
+        raise ValueError('unknown trace file format')
+    count = 0
+
+    def counted( messages ):
+        nonlocal count
+        for m in messages:
+            count = count + 1
+            yield m
+
+    messages = counted( trace.interpreted() )
+    rows = trace.collapsedRows( messages = messages ) if collapse else ( trace.row(*m) for m in messages )
+    output = Path(output)
+    partial = output.parent / ('.partial-' + output.name)
+    try:
+        trace.toCSV( partial, rows = rows )
+        os.replace(partial, output)
+    except BaseException:
+        partial.unlink(missing_ok = True)
+        raise
+    return count, os.path.getsize(source), time.perf_counter() - start
+
+
+
+class ConversionService():
+    '''
+    > outputDirectory: directory for converted files, next to the source if None
+    > extension: appended to the source name (.csv, .csv.gz, ...)
+    > workers: number of worker processes, default is number of CPUs
+    > collapse: collapse repeated messages (see CanTrace.collapsedRows())
+    '''
+    def __init__(self, outputDirectory : str = None, extension : str = '.csv', workers : int = None, collapse : bool = False ):
+        self.outputDirectory = Path(outputDirectory) if outputDirectory else None
+        if self.outputDirectory:
+            self.outputDirectory.mkdir(parents = True, exist_ok = True)
+        self.extension = extension
+        self.collapse = collapse
+        self.executor = ProcessPoolExecutor( max_workers = workers, initializer = _initWorker,
+                                             initargs = (locale.setlocale(locale.LC_NUMERIC),) )
+        self.workers = workers or os.cpu_count()
+        self.lock = threading.Lock()
+        self.started = time.time()
+        self.pending = 0 # jobs queued or running
+        self.done = 0
+        self.failed = 0
+        self.messages = 0
+        self.bytesRead = 0
+        self.busySeconds = 0.0 # sum of conversion times of all workers
+
+
+    def outputName(self, source : str ) -> Path:
+        source = Path(source)
+        directory = self.outputDirectory or source.parent
+        return directory / (source.name + self.extension)
+
+
+    def submit(self, source : str ) -> Path:
+        '''
+        queues conversion of source, returns the output file name
+        '''
+        output = self.outputName(source)
+        with self.lock:
+            self.pending = self.pending + 1
+        job = self.executor.submit(_convert, str(source), str(output), self.collapse)
+        job.add_done_callback( lambda job: self.finished(source, output, job) )
+        return output
+
+
+    def finished(self, source : str, output : Path, job ):
+        try:
+            messages, size, seconds = job.result()
+        except Exception as e:
+            with self.lock:
+                self.pending = self.pending - 1
+                self.failed = self.failed + 1
+            print( f'failed {source}: {e}', flush = True )
+            return
+        with self.lock:
+            self.pending = self.pending - 1
+            self.done = self.done + 1
+            self.messages = self.messages + messages
+            self.bytesRead = self.bytesRead + size
+            self.busySeconds = self.busySeconds + seconds
+        print( f'converted {source} -> {output}: {messages} messages in {seconds:0.2f} s', flush = True )
+
+
+    def stats(self) -> dict:
+        with self.lock:
+            busy = self.busySeconds
+            return {
+                'workers' : self.workers,
+                'pending' : self.pending,
+                'done' : self.done,
+                'failed' : self.failed,
+                'messages' : self.messages,
+                'bytes' : self.bytesRead,
+                'uptime [s]' : round(time.time() - self.started, 1),
+                'messages/s' : round(self.messages / busy, 1) if busy else 0.0, # per worker
+                'MB/s' : round(self.bytesRead / busy / 1e6, 3) if busy else 0.0 # per worker
+            }
+
+
+    def watch(self, directory : str, interval : float = 2.0 ):
+        '''
+        converts files appearing in directory. A file is converted when its size and modification time
+        did not change for one interval and its output is missing or older. Does not return.
+        '''
+        directory = Path(directory)
+        seen = dict() # name -> (size, mtime) of last poll
+        submitted = dict() # name -> (size, mtime) when queued
+        print( f'watching {directory}', flush = True )
+        while True:
+            current = dict()
+            with os.scandir(directory) as entries:
+                for e in entries:
+                    if e.is_file() and not e.name.startswith('.'):
+                        s = e.stat()
+                        current[e.name] = (s.st_size, s.st_mtime)
+            for name, state in current.items():
+                if seen.get(name) != state or submitted.get(name) == state:
+                    continue # still being written or already queued
+                output = self.outputName(directory / name)
+                if output.exists() and output.stat().st_mtime >= state[1]:
+                    continue # converted before
+                submitted[name] = state
+                self.submit(directory / name)
+            seen = current
+            time.sleep(interval)
+
+
+    def listen(self, port : int ):
+        '''
+        accepts jobs on a local TCP socket (127.0.0.1) in a background thread.
+        Each line is a trace file name; 'stats' returns the metrics as JSON.
+        Needs an output directory, so that clients cannot write next to arbitrary files.
+        '''
+        if self.outputDirectory is None:
+            raise ValueError('listening needs an output directory')
+        service = self
+
+        class Handler(socketserver.StreamRequestHandler):
+            def handle(self):
+                for line in self.rfile:
+                    request = line.decode('utf-8').strip()
+                    if not request:
+                        continue
+                    if request.lower() == 'stats':
+                        answer = json.dumps(service.stats())
+                    elif Path(request).is_file():
+                        answer = f'queued {request} -> {service.submit(request)}'
+                    else:
+                        answer = f'error: file not found {request}'
+                    self.wfile.write((answer + '\n').encode('utf-8'))
+
+        server = socketserver.ThreadingTCPServer(('127.0.0.1', port), Handler)
+        server.daemon_threads = True
+        threading.Thread(target = server.serve_forever, daemon = True).start()
+        print( f'listening on 127.0.0.1:{port}', flush = True )
+        return server
+
+
+    def shutdown(self):
+        self.executor.shutdown(wait = True, cancel_futures = True)
+        print( json.dumps(self.stats()), flush = True )
+
+
+
+def runService( watch : str = None, port : int = None, outputDirectory : str = None, extension : str = '.csv',
+               workers : int = None, collapse : bool = False ):
+    '''
+    runs until interrupted (Ctrl+C)
+    > watch: directory to watch, converted files go to watch/converted unless outputDirectory is given
+    > port: local TCP port for jobs and metrics
+    '''
+    if watch and not outputDirectory:
+        outputDirectory = str(Path(watch) / 'converted')
+    service = ConversionService(outputDirectory, extension, workers, collapse)
+    try:
+        if port:
+            service.listen(port)
+        if watch:
+            service.watch(watch)
+        else:
+            while True:
+                time.sleep(3600)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        service.shutdown()
@@ -0,0 +1,281 @@
+# This file is part of https://github.com/hilch/canopen-message-interpreter.
+#
+#    canopen-message-interpreter is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    canopen-message-interpreter is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with canopen-message-interpreter.  If not, see <http://www.gnu.org/licenses/>.
+
+# trigger rules evaluated on the interpreted messages while the trace is read
+
+from collections import deque
+import heapq
+from modules.canobjects import CANopenType, CanOpenMessage
+from modules.cantraces import CanTrace, CanTraceEntry, CSVDialect
+
+
+class Rule():
+    '''
+    trigger condition, a message triggers if all given conditions match.
+    > spec: comma separated conditions, e.g. 'type=EMCY,node=5'
+        name=TEXT         name of the rule (default: spec)
+        id=ID[/MASK]      CAN-ID, optionally masked (id=0x700/0x780)
+        data=HEX[/MASK]   leading data bytes, optionally masked (type=SDO_T,data=80/E0: SDO abort by server)
+        type=TYPE         CANopen type (NMT, EMCY, SYNC, SDO_T, SDO_R, ERR_CTRL, ...),
+                          EMCY matches emergencies of nodes only, SYNC the SYNC message (EMCY of node 0)
+        node=N            node number
+        abort=CODE        SDO abort code, * for any abort
+        text=TEXT         interpretation contains TEXT
+        heartbeat=MS      no heartbeat of node(s) for more than MS milliseconds, only together with node and name.
+                          At the end of the trace a node is also reported if its heartbeat is overdue
+                          (silent for more than 1.5 of its last heartbeat period) before MS elapsed.
+    '''
+    def __init__(self, spec : str ):
+        self.name = spec
+        self.canId = None
+        self.idMask = None
+        self.data = None
+        self.dataMask = None
+        self.type = None
+        self.node = None
+        self.abortCode = None # 0 = any abort
+        self.text = None
+        self.heartbeatTimeout = None
+
+        for condition in spec.split(','):
+            key, _, value = condition.partition('=')
+            key = key.strip().lower()
+            value = value.strip()
+            try:
+                if key == 'name':
+                    self.name = value
+                elif key == 'id':
+                    canId, _, mask = value.partition('/')
+                    self.canId = int(canId, 0)
+                    if mask:
+                        self.idMask = int(mask, 0)
+                        self.canId &= self.idMask
+                elif key == 'data':
+                    data, _, mask = value.partition('/')
+                    self.data = bytes.fromhex(data)
+                    self.dataMask = bytes.fromhex(mask) if mask else b'\xff' * len(self.data)
+                    if len(self.dataMask) != len(self.data):
+                        raise ValueError('data and mask differ in length')
+                    self.data = bytes(d & m for d, m in zip(self.data, self.dataMask))
+                elif key == 'type':
+                    if value.upper() == 'SYNC': # decoded as EMCY of node 0
+                        self.type = CANopenType.EMCY
+                        self.node = 0
+                    else:
+                        self.type = CANopenType[value.upper()]
+                elif key == 'node':
+                    self.node = int(value, 0)
+                elif key == 'abort':
+                    self.abortCode = 0 if value == '*' else int(value, 0)
+                elif key == 'text':
+                    self.text = value
+                elif key == 'heartbeat':
+                    self.heartbeatTimeout = float(value)
+                else:
+                    raise ValueError('unknown condition')
+            except KeyError:
+                raise ValueError(f'rule "{spec}": unknown CANopen type "{value}"') from None
+            except ValueError as e:
+                raise ValueError(f'rule "{spec}": invalid condition "{condition.strip()}" ({e})') from None
+
+        if self.heartbeatTimeout is not None and (self.canId is not None or self.data is not None or self.type is not None
+                                                  or self.abortCode is not None or self.text is not None):
+            raise ValueError(f'rule "{spec}": heartbeat can only be combined with node and name')
+
+
+    def matches(self, e : CanTraceEntry, interpreted : CanOpenMessage ) -> bool:
+        '''
+        checks all conditions except heartbeat timeout
+        '''
+        if self.canId is not None:
+            if (e.canId & self.idMask if self.idMask is not None else e.canId) != self.canId:
+                return False
+        if self.data is not None:
+            if e.data is None or len(e.data) < len(self.data):
+                return False
+            for d, m, v in zip(e.data, self.dataMask, self.data):
+                if d & m != v:
+                    return False
+        if self.type is not None and interpreted.canOpenObject != self.type:
+            return False
+        if self.node is not None and interpreted.nodeNumber != self.node:
+            return False
+        if self.type == CANopenType.EMCY and self.node is None and interpreted.nodeNumber == 0: # SYNC
+            return False
+        if self.abortCode is not None:
+            if interpreted.abortCode == 0 or (self.abortCode != 0 and interpreted.abortCode != self.abortCode):
+                return False
+        if self.text is not None and self.text not in interpreted.text:
+            return False
+        return True
+
+
+    def __repr__(self):
+        return('Rule: ' + self.name )
+
+
+
+class RuleEngine():
+    '''
+    evaluates many rules per message. Rules with an unmasked CAN-ID are looked up by CAN-ID,
+    rules with a CANopen type by type, so only few rules are checked per message.
+    > rules: list of Rule
+    '''
+    def __init__(self, rules : list ):
+        self.byId = dict() # CAN id -> rules
+        self.byType = dict() # CANopenType -> rules
+        self.others = list()
+        self.heartbeatRules = list()
+        for r in rules:
+            if r.heartbeatTimeout is not None:
+                self.heartbeatRules.append(r)
+            elif r.canId is not None and r.idMask is None:
+                self.byId.setdefault(r.canId, []).append(r)
+            elif r.type is not None:
+                self.byType.setdefault(r.type, []).append(r)
+            else:
+                self.others.append(r)
+
+        self.heartbeats = dict() # (source, bus, node) -> time of last heartbeat
+        self.periods = dict() # (source, bus, node) -> time between the last two heartbeats
+        self.deadlines = list() # heap of (deadline, rule number, (source, bus, node), time of heartbeat)
+
+
+    def evaluate(self, e : CanTraceEntry, interpreted : CanOpenMessage ) -> list:
+        '''
+        returns the names of all rules triggered by this message
+        '''
+        hits = []
+        if self.deadlines:
+            self.checkHeartbeats(e.milliseconds, hits)
+        for r in self.byId.get(e.canId, ()):
+            if r.matches(e, interpreted): hits.append(r.name)
+        for r in self.byType.get(interpreted.canOpenObject, ()):
+            if r.matches(e, interpreted): hits.append(r.name)
+        for r in self.others:
+            if r.matches(e, interpreted): hits.append(r.name)
+        if self.heartbeatRules and interpreted.canOpenObject == CANopenType.ERR_CTRL and e.dlc == 1 and e.data is not None:
+            self.watchHeartbeat(e, interpreted.nodeNumber)
+        return hits
+
+
+    def watchHeartbeat(self, e : CanTraceEntry, node : int ):
+        key = (e.source, e.bus, node)
+        if key in self.heartbeats:
+            self.periods[key] = e.milliseconds - self.heartbeats[key]
+        self.heartbeats[key] = e.milliseconds
+        for i, r in enumerate(self.heartbeatRules):
+            if r.node is None or r.node == node:
+                heapq.heappush(self.deadlines, (e.milliseconds + r.heartbeatTimeout, i, key, e.milliseconds))
+
+
+    def checkHeartbeats(self, milliseconds : float, hits : list ):
+        while self.deadlines and self.deadlines[0][0] < milliseconds:
+            deadline, i, key, heartbeat = heapq.heappop(self.deadlines)
+            if self.heartbeats.get(key) == heartbeat: # no newer heartbeat since
+                hits.append(f'{self.heartbeatRules[i].name} (node {key[2]}, last heartbeat at {heartbeat:0.1f} ms)')
+
+
+    def finish(self, milliseconds : float ) -> list:
+        '''
+        returns the heartbeat timeouts still pending at the end of the trace
+        whose node missed its heartbeat period
+        > milliseconds: time of the last message
+        '''
+        hits = []
+        self.checkHeartbeats(milliseconds, hits)
+        for deadline, i, key, heartbeat in sorted(self.deadlines):
+            period = self.periods.get(key)
+            if self.heartbeats.get(key) == heartbeat and period and milliseconds - heartbeat > 1.5 * period:
+                hits.append(f'{self.heartbeatRules[i].name} (node {key[2]}, last heartbeat at {heartbeat:0.1f} ms, missing until end of trace)')
+        self.deadlines.clear()
+        return hits
+
+
+
+class TriggeredTrace( CanTrace):
+    '''
+    selects only the messages around triggering messages, for all outputs (CSV, SQLite, per bus)
+    > trace: trace to evaluate, should be opened with lazy = True for early exit
+    > rules: list of Rule
+    > before: number of messages selected before each trigger
+    > after: number of messages selected after each trigger
+    > first: stop reading the trace after the first trigger
+    '''
+    def __init__(self, trace : CanTrace, rules : list, before : int = 10, after : int = 10, first : bool = False ):
+        super().__init__()
+        self.trace = trace
+        self.canTraceType = trace.canTraceType
+        self.header = trace.header + ['Trigger']
+        self.engine = RuleEngine(rules)
+        self.before = before
+        self.after = after
+        self.first = first
+        self.hits = 0
+        self.entries = None
+
+    def parse(self):
+        return iter(self.trace)
+
+    '''
+    yields (entry, interpretation, names of triggered rules), heartbeat timeouts
+    still pending at the end of the trace are reported with the last message
+    '''
+    def evaluated(self, progress = None ):
+        last = None
+        for e, interpreted in self.trace.interpreted(progress):
+            names = self.engine.evaluate(e, interpreted)
+            if last is not None:
+                yield last
+            last = (e, interpreted, names)
+        if last is not None:
+            yield last[0], last[1], last[2] + self.engine.finish(last[0].milliseconds)
+
+    def interpreted(self, progress = None ):
+        before = deque(maxlen = self.before) # (entry, interpretation), written only if a trigger follows
+        remaining = 0 # messages to write after the last trigger
+        for e, interpreted, names in self.evaluated(progress):
+            if names and not (self.first and self.hits > 0): # with first, later triggers are only context
+                self.hits = self.hits + 1
+                yield from before
+                before.clear()
+                e.trigger = ', '.join(names)
+                yield e, interpreted
+                remaining = self.after
+            elif remaining > 0:
+                remaining = remaining - 1
+                yield e, interpreted
+            elif self.before > 0:
+                before.append((e, interpreted))
+            if self.first and self.hits > 0 and remaining == 0:
+                return
+
+    def row(self, e : CanTraceEntry, interpreted : CanOpenMessage ) -> list:
+        return self.trace.row(e, interpreted) + [e.trigger or '']
+
+    '''
+    the rules are evaluated on the whole trace, so the selected messages are split per bus
+    and written one after another instead of interpreting the buses in parallel processes
+    '''
+    def toCSVPerBus(self, csvfilename, dialect = CSVDialect.EXCEL_DIALECT1, background = False, workers = None, collapse = False ):
+        buses = dict() # (source, bus) -> (entry, interpretation)
+        for e, interpreted in self.interpreted():
+            buses.setdefault((e.source, e.bus), []).append((e, interpreted))
+        filenames = []
+        for (source, bus), messages in buses.items():
+            filenames.append( self.busFilename(csvfilename, source, bus) )
+            rows = self.collapsedRows(messages = messages) if collapse else ( self.row(*m) for m in messages )
+            self.toCSV( filenames[-1], dialect, background, rows = rows )
+        return filenames